@@ -23,6 +23,7 @@ from pydispatch import dispatcher
 
 # from ava.util import crypto
 from ..user.signals import USER_NOTIFIED
+from ..job.signals import JOB_DONE_BATCH
 from . import context
 from .defines import INSTALLED_ENGINES, AVA_AGENT_SECRET, AVA_SWARM_SECRET
 from .signals import AGENT_STARTED, AGENT_STOPPING
@@ -182,7 +183,12 @@ class Agent(object):
         :param kwargs:
         :return:
         """
-        self._dispatcher.send(*args, **kwargs)
+        if signal == JOB_DONE_BATCH:
+            # receivers still get one event per job.
+            for job_ctx in kwargs['job_ctxs']:
+                self._dispatcher.send(*args, job_ctx=job_ctx)
+        else:
+            self._dispatcher.send(*args, **kwargs)
 
         # dispatch this signal to the shell.
         if self._outbox:
@@ -5,15 +5,21 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 Loading modules that provide task codes.
 """
 import os
-import time
+import sys
+import imp
+import binascii
+import itertools
 import ast
-import glob
+import marshal
+import hashlib
+import re
 import logging
+import six
 import gevent
-import uuid
-from gevent import Greenlet
+from gevent.event import Event
+from gevent.pool import Pool
 
-from .validator import ScriptValidator
+from .validator import ScriptValidator, rules_digest
 from ava import launcher
 
 from . import signals
@@ -22,15 +28,98 @@ logger = logging.getLogger(__name__)
 
 _AVATARS_DIR = 'jobs'
 
+# sub-folder of the jobs directory holding marshaled job code. Each file
+# holds the cache magic, the SHA-1 digest of the script it was compiled
+# from, then the marshaled code object.
+_JOBCACHE_DIR = '__jobcache__'
+_JOBCACHE_EXT = '.mc'
+# bump the format byte whenever the layout of compiled jobs changes. The
+# digest of validation rules invalidates code validated by older rules.
+_JOBCACHE_MAGIC = imp.get_magic() + b'\x02' + rules_digest()
+
+# job scripts are compiled into a function of this name taking the context
+# as 'ava' and returning 'result'.
+_JOB_FUNC = '__job__'
+_JOB_TEMPLATE = """def __job__(ava):
+    result = None
+    return result
+"""
+
+# file names of job scripts.
+_JOB_FILE_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9_]*\.py$')
+
+# sequence for generating names of submitted jobs, randomly seeded.
+_job_counter = itertools.count(int(binascii.hexlify(os.urandom(3)), 16))
+
+# max number of greenlets for loading jobs concurrently.
+_LOAD_POOL_SIZE = 16
+
+
+def _capture(func, *args):
+    """ Calls the function, returning its error rather than raising it.
+
+    :return: tuple of the result and the exc_info of the error.
+    """
+    try:
+        return func(*args), None
+    except Exception:
+        return None, sys.exc_info()
+
+
+def _read_script(path):
+    """ Reads the whole script file with unbuffered reads sized to the file.
+
+    :return: tuple of the script's raw bytes and its stat result.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        st = os.fstat(fd)
+        chunks = []
+        remaining = st.st_size
+        while remaining > 0:
+            buf = os.read(fd, remaining)
+            if not buf:
+                break
+            chunks.append(buf)
+            remaining -= len(buf)
+        return b''.join(chunks), st
+    finally:
+        os.close(fd)
+
+
+def _wrap_job(node):
+    """ Moves the body of the parsed script into the job function.
+
+    :param node: the module node of the job script.
+    :return: the module node defining the job function.
+    """
+    wrapper = ast.parse(_JOB_TEMPLATE, mode='exec')
+    func = wrapper.body[0]
+
+    # keeps line numbers ascending for the script's own statements.
+    last_line = max(getattr(n, 'lineno', 1) for n in ast.walk(node))
+    for n in ast.walk(wrapper):
+        if 'lineno' in n._attributes:
+            n.lineno = 1
+    for n in ast.walk(func.body[-1]):
+        if 'lineno' in n._attributes:
+            n.lineno = last_line
+
+    func.body[1:1] = node.body
+    return wrapper
+
 
 class JobInfo(object):
     """ Metadata of a task definition
     """
 
+    __slots__ = ('_name', '_script', '_code', '_globals')
+
     def __init__(self, name, script, acode):
         self._name = name
         self._script = script
         self._code = acode
+        self._globals = {'__builtins__': __builtins__, '__name__': name}
 
     @property
     def name(self):
@@ -47,11 +136,19 @@ class JobInfo(object):
     def code(self):
         return self._code
 
+    @property
+    def globals(self):
+        """ The global scope the job's code runs in, reused across runs.
+        """
+        return self._globals
+
 
 class JobContext(object):
     """ The context of a task object.
     """
 
+    __slots__ = ('_job_name', '_scope', '_core', 'exception', 'result')
+
     _logger = logging.getLogger('ava.job')
 
     def __init__(self, job_name, core_context):
@@ -74,31 +171,22 @@ class JobContext(object):
         self._core.notify_user(msg, title)
 
     def sleep(self, secs):
-        time.sleep(secs)
-
+        gevent.sleep(secs)
 
-class JobRunner(Greenlet):
-    def __init__(self, engine, job_info, job_context):
-        Greenlet.__init__(self)
-        self.engine = engine
-        self.job_ctx = job_context
-        self.job_info = job_info
 
-    def _run(self):
-        logger.info("Running job: %s", self.job_ctx.name)
-
-        try:
-            global_scope = dict()
-            global_scope['__builtin__'] = {}
+def _run_job(engine, job_info, job_ctx):
+    """ Runs the job in the current greenlet and notifies the engine.
+    """
+    logger.info("Running job: %s", job_ctx.name)
 
-            exec self.job_info.code in global_scope, self.job_ctx._scope
-            if 'result' in self.job_ctx._scope:
-                self.job_ctx.result = self.job_ctx._scope.get('result')
-        except Exception as ex:
-            logger.error("Error in running job: %s", self.job_ctx.name, exc_info=True)
-            self.job_ctx.exception = ex
-        finally:
-            self.engine.job_done(self.job_ctx)
+    try:
+        exec job_info.code in job_info.globals, job_ctx._scope
+        job_ctx.result = job_ctx._scope[_JOB_FUNC](job_ctx)
+    except Exception as ex:
+        logger.error("Error in running job: %s", job_ctx.name, exc_info=True)
+        job_ctx.exception = ex
+    finally:
+        engine.job_done(job_ctx)
 
 
 class JobEngine(object):
@@ -113,13 +201,163 @@ class JobEngine(object):
 
         self.jobs_path = os.path.join(launcher.get_app_dir(), _AVATARS_DIR)
         self.jobs_path = os.path.abspath(self.jobs_path)
+        self.cache_path = os.path.join(self.jobs_path, _JOBCACHE_DIR)
+        # stateless, shared by the loading greenlets and compile threads.
         self.validator = ScriptValidator()
+        # reads job files and compiles submitted scripts off the hub.
+        self._threadpool = gevent.get_hub().threadpool
         self._core_context = None
-        self._stopping = False
+        self._stop_event = Event()
+        # contexts of finished jobs yet to be signalled.
+        self._pending_done = []
+        self._done_event = Event()
 
     def _scan_jobs(self):
-        pattern = os.path.join(self.jobs_path, '[a-zA-Z][a-zA-Z0-9_]*.py')
-        return glob.glob(pattern)
+        try:
+            names = os.listdir(self.jobs_path)
+        except OSError:
+            return []
+
+        return [os.path.join(self.jobs_path, name) for name in names
+                if _JOB_FILE_RE.match(name)]
+
+    def _cache_file(self, name, st):
+        """ Gets the cache file for a job, keyed by the source mtime and size.
+        """
+        filename = '%s.%d.%d%s' % (name, int(st.st_mtime * 1000000),
+                                   st.st_size, _JOBCACHE_EXT)
+        return os.path.join(self.cache_path, filename)
+
+    def _list_cache(self):
+        """ Lists existing cache files, whatever their keys are.
+
+        :return: dict of job name to the paths of its cache files.
+        """
+        try:
+            names = os.listdir(self.cache_path)
+        except OSError:
+            return {}
+
+        cached = {}
+        for f in names:
+            parts = f.split('.')
+            if len(parts) == 4 and f.endswith(_JOBCACHE_EXT):
+                path = os.path.join(self.cache_path, f)
+                cached.setdefault(parts[0], []).append(path)
+        return cached
+
+    def _read_cached_code(self, cachefile, digest):
+        """ Reads code object from the cache file.
+
+        :return: the code object or None if invalid or for another source.
+        """
+        try:
+            with open(cachefile, 'rb') as f:
+                magic = f.read(len(_JOBCACHE_MAGIC))
+                if magic != _JOBCACHE_MAGIC:
+                    return None
+                if f.read(len(digest)) != digest:
+                    return None
+                return marshal.loads(f.read())
+        except Exception:
+            logger.warning("Invalid job cache: %s", cachefile, exc_info=True)
+            return None
+
+    def _load_cached_code(self, cachefile, cached_files, digest):
+        """ Loads code object cached for the job's current source.
+
+        A cache file with a stale key is reused, and renamed, if it was
+        built from the same source, e.g. when the script was only touched.
+
+        :return: the code object or None if not cached.
+        """
+        if cachefile in cached_files:
+            return self._read_cached_code(cachefile, digest)
+
+        for f in cached_files:
+            acode = self._read_cached_code(f, digest)
+            if acode is not None:
+                try:
+                    os.rename(f, cachefile)
+                except OSError:
+                    pass
+                return acode
+        return None
+
+    def _save_cached_code(self, name, cachefile, cached_files, digest,
+                          acode):
+        """ Saves the code object to the cache file and removes stale ones.
+        """
+        try:
+            if not os.path.isdir(self.cache_path):
+                os.makedirs(self.cache_path)
+
+            for f in cached_files:
+                os.remove(f)
+
+            tmpfile = cachefile + '.tmp'
+            with open(tmpfile, 'wb') as f:
+                f.write(_JOBCACHE_MAGIC)
+                f.write(digest)
+                f.write(marshal.dumps(acode))
+            os.rename(tmpfile, cachefile)
+        except (IOError, OSError):
+            logger.warning("Failed to cache job: %s", name, exc_info=True)
+
+    def _parse_validate_compile(self, script, filename):
+        """ Parses, validates and compiles the script.
+
+        :return: the code object defining the job function.
+        """
+        node = ast.parse(script, filename=filename, mode='exec')
+        self.validator.visit(node)
+        return compile(_wrap_job(node), filename=filename, mode='exec')
+
+    def _run_in_threadpool(self, func, *args):
+        """ Runs the function in a pool thread and re-raises its error here.
+
+        Errors such as rejected scripts are expected, so they are passed back
+        rather than raised in the pool thread, which the hub would report.
+        """
+        result, exc_info = self._threadpool.apply(_capture, (func,) + args)
+        if exc_info is not None:
+            six.reraise(*exc_info)
+        return result
+
+    def _load_job(self, s, cached=None):
+        """ Loads the job defined by the given script file.
+
+        :param s: the path to the script file.
+        :param cached: the cache listing from _list_cache.
+        :return: tuple of job info and context, or None if failed.
+        """
+        name = os.path.basename(s)
+        if '__init__.py' == name:
+            return None
+
+        # gets the basename without extension part.
+        name = os.path.splitext(name)[0]
+        try:
+            logger.debug("Loading job: %s", name)
+            # os.read releases the GIL, so reads of other jobs overlap.
+            script, st = self._run_in_threadpool(_read_script, s)
+
+            digest = hashlib.sha1(script).digest()
+            cachefile = self._cache_file(name, st)
+            if cached is None:
+                cached = self._list_cache()
+            cached_files = cached.get(name, [])
+            acode = self._load_cached_code(cachefile, cached_files, digest)
+            if acode is None:
+                acode = self._parse_validate_compile(script, name)
+                self._save_cached_code(name, cachefile, cached_files, digest,
+                                       acode)
+
+            job_info = JobInfo(name, script, acode)
+            return job_info, JobContext(name, self._core_context)
+        except Exception:
+            logger.error("Failed to load job: %s", name, exc_info=True)
+            return None
 
     def _load_jobs(self, ctx):
         logger.debug("Job directory: %s", self.jobs_path)
@@ -128,45 +366,31 @@ class JobEngine(object):
 
         logger.debug("Found %d job(s)" % len(job_files))
 
-        for s in job_files:
-            name = os.path.basename(s)
-            if '__init__.py' == name:
+        cached = self._list_cache()
+        pool = Pool(_LOAD_POOL_SIZE)
+        for loaded in pool.map(lambda s: self._load_job(s, cached), job_files):
+            if loaded is None:
                 continue
 
-            # gets the basename without extension part.
-            name = os.path.splitext(name)[0]
-            try:
-                logger.debug("Loading job: %s", name)
-                with open(s, 'r') as f:
-                    script = f.read()
-
-                node = ast.parse(script, filename=name, mode='exec')
-                self.validator.visit(node)
-                acode = compile(node, filename=name, mode='exec')
-                job_info = JobInfo(name, script, acode)
-                self.jobs[name] = job_info
-                self.contexts[name] = JobContext(name, self._core_context)
-            except Exception:
-                logger.error("Failed to load job: %s", name, exc_info=True)
+            job_info, job_ctx = loaded
+            self.jobs[job_info.name] = job_info
+            self.contexts[job_info.name] = job_ctx
 
     def _run_jobs(self):
 
         logger.debug("Starting jobs...")
-        for task_name in self.jobs:
-            info = self.jobs[task_name]
+        # snapshot since finished jobs are removed from self.jobs.
+        for task_name, info in tuple(self.jobs.items()):
             ctx = self.contexts[task_name]
-            runner = JobRunner(self, info, ctx)
-            self.runners[task_name] = runner
-            runner.start()
+            self.runners[task_name] = gevent.spawn(_run_job, self, info, ctx)
 
-        while not self._stopping:
-            time.sleep(1)
+        self._stop_event.wait()
 
         logger.info("All jobs stopped.")
 
     def _gen_job_name(self):
         while True:
-            name = 'J' + uuid.uuid1().hex[:8]
+            name = 'J%08x' % (next(_job_counter) & 0xffffffff)
             if name not in self.jobs:
                 return name
 
@@ -175,16 +399,14 @@ class JobEngine(object):
 
         try:
             script = job['script']
-            node = ast.parse(script, filename=job_name, mode='exec')
-            self.validator.visit(node)
-            acode = compile(node, filename=job_name, mode='exec')
+            acode = self._run_in_threadpool(self._parse_validate_compile,
+                                            script, job_name)
             job_info = JobInfo(job_name, script, acode)
             self.jobs[job_name] = job_info
             ctx = JobContext(job_name, self._core_context)
             self.contexts[job_name] = ctx
-            runner = JobRunner(self, job_info, ctx)
-            self.runners[job_name] = runner
-            runner.start()
+            self.runners[job_name] = gevent.spawn(_run_job, self, job_info,
+                                                  ctx)
             self._core_context.send(signals.JOB_ACCEPTED, job_name=job_name)
             return job_name
         except (Exception, SyntaxError) as ex:
@@ -204,16 +426,53 @@ class JobEngine(object):
         :return:
         """
         name = job_context.name
-        if name in self.jobs:
-            del self.jobs[name]
+        self.jobs.pop(name, None)
+        self.runners.pop(name, None)
+
+        if self._stop_event.is_set():
+            # the flusher is gone once the engine stops.
+            self._send_done([job_context])
+            return
 
-        if name in self.runners:
-            del self.runners[name]
+        self._pending_done.append(job_context)
+        self._done_event.set()
+
+    def _send_signal(self, sig, **kwargs):
+        try:
+            self._core_context.send(sig, **kwargs)
+        except Exception:
+            logger.error("Failed to send signal: %s", sig, exc_info=True)
 
+    def _send_done(self, job_contexts):
+        """ Sends one batch signal if several jobs are done, otherwise the
+        per-job signal.
+        """
+        if len(job_contexts) > 1:
+            self._send_signal(signals.JOB_DONE_BATCH, job_ctxs=job_contexts)
+            return
+
+        job_context = job_contexts[0]
         if job_context.exception is not None:
-            self._core_context.send(signals.JOB_FAILED, job_ctx=job_context)
+            sig = signals.JOB_FAILED
         else:
-            self._core_context.send(signals.JOB_FINISHED, job_ctx=job_context)
+            sig = signals.JOB_FINISHED
+        self._send_signal(sig, job_ctx=job_context)
+
+    def _flush_done(self):
+        """ Signals jobs done in the same tick together.
+        """
+        while True:
+            self._done_event.wait()
+            # lets other jobs finishing in this tick join the batch.
+            gevent.sleep(0)
+            self._done_event.clear()
+
+            pending, self._pending_done = self._pending_done, []
+            if pending:
+                self._send_done(pending)
+
+            if self._stop_event.is_set():
+                break
 
     def start(self, ctx):
         logger.debug("Starting job engine...")
@@ -221,8 +480,10 @@ class JobEngine(object):
         self._core_context = ctx
         self._load_jobs(ctx)
         ctx.add_child_greenlet(gevent.spawn(self._run_jobs))
+        ctx.add_child_greenlet(gevent.spawn(self._flush_done))
         logger.debug("Job engine started.")
 
     def stop(self, ctx):
-        self._stopping = True
+        self._stop_event.set()
+        self._done_event.set()
         logger.debug("Job engine stopped.")
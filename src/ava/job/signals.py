@@ -5,3 +5,6 @@ JOB_ACCEPTED = 'job_accepted'
 JOB_REJECTED = 'job_rejected'
 JOB_FINISHED = 'job_finished'
 JOB_FAILED = 'job_failed'
+# a number of jobs finished or failed in the same tick, sent instead of
+# their JOB_FINISHED/JOB_FAILED signals.
+JOB_DONE_BATCH = 'job_done_batch'
@@ -2,7 +2,9 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import ast
+import hashlib
 import logging
+import marshal
 from sys import version_info
 
 supported_nodes = ('arg', 'assert', 'assign', 'attribute', 'augassign',
@@ -21,7 +23,28 @@ reserved_names = (
 _logger = logging.getLogger(__name__)
 
 
+def rules_digest():
+    """ Gets a digest of the validation rules.
+
+    Covers the allowed nodes, the reserved names and the code of the
+    validator's handlers, so that any change to the rules changes the digest.
+    """
+    h = hashlib.sha1()
+    h.update(repr((supported_nodes, reserved_names)).encode('utf-8'))
+    for name, attr in sorted(vars(ScriptValidator).items()):
+        code = getattr(attr, '__code__', None)
+        if code is not None:
+            h.update(name.encode('utf-8'))
+            h.update(marshal.dumps(code))
+    return h.digest()
+
+
 class ScriptValidator(ast.NodeVisitor):
+    """ Checks that a job script only uses the supported subset of Python.
+
+    The validator keeps no state across visits besides the read-only handler
+    table, so one instance can be shared by greenlets and threads.
+    """
 
     def __init__(self):
         self.node_handlers = dict(((node, getattr(self, "on_%s" % node))
@@ -5,9 +5,16 @@ from ..core import get_core_context, AvaError
 
 _task_engine = None
 
+# memo of generated task keys, bounded to this many entries.
+_TASK_KEY_CACHE_SIZE = 4096
+_task_key_cache = {}
+
 
 def _get_task_engine():
-    return get_core_context().lookup('taskengine')
+    global _task_engine
+    if _task_engine is None:
+        _task_engine = get_core_context().lookup('taskengine')
+    return _task_engine
 
 
 def task(func):
@@ -28,15 +35,16 @@ def task_key(mod_name, func_name):
     :param func_name: the function name
     :return: the key for identifying the task.
     """
-    try:
-        idx = mod_name.rindex('.')
-    except ValueError:
-        idx = -1
-
-    if idx < 0:
-        return mod_name + '.' + func_name
-    else:
-        return mod_name[idx+1:] + '.' + func_name
+    key = (mod_name, func_name)
+    v = _task_key_cache.get(key)
+    if v is not None:
+        return v
+
+    _, sep, tail = mod_name.rpartition('.')
+    v = (tail if sep else mod_name) + '.' + func_name
+    if len(_task_key_cache) < _TASK_KEY_CACHE_SIZE:
+        _task_key_cache[key] = v
+    return v
 
 
 __all__ =[
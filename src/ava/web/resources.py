@@ -2,6 +2,9 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import os
+import stat
+import time
+import mimetypes
 
 from ..util import resource_path
 from . import bottle
@@ -10,18 +13,138 @@ _WEBROOT = resource_path('webfront')
 
 _JSROOT = os.path.join(_WEBROOT, 'js')
 
+_WEBROOT_ABS = os.path.abspath(_WEBROOT) + os.sep
+
+# files smaller than this are kept in memory once read.
+_SMALL_FILE_LIMIT = 256 * 1024
+
+_CACHE_CONTROL = 'public, max-age=60'
+
+# absolute path -> ((mtime, size), body, headers)
+_small_cache = {}
+
+# requested file name -> absolute path of an existing file in the web root,
+# cleared once full.
+_RESOLVE_CACHE_SIZE = 512
+_resolve_cache = {}
+
+
+def _http_date(secs):
+    return time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(secs))
+
+
+def _headers(path, stats, etag):
+    """ Builds the response headers for a small static file.
+    """
+    headers = dict()
+    mimetype, encoding = mimetypes.guess_type(path)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if mimetype:
+        if mimetype[:5] == 'text/' and 'charset' not in mimetype:
+            mimetype += '; charset=UTF-8'
+        headers['Content-Type'] = mimetype
+
+    headers['Content-Length'] = stats.st_size
+    headers['Last-Modified'] = _http_date(stats.st_mtime)
+    headers['ETag'] = etag
+    headers['Cache-Control'] = _CACHE_CONTROL
+    return headers
+
+
+def _resolve(filename):
+    """ Resolves the requested file name against the web root.
+
+    Only names of existing files are remembered, so that probes for missing
+    or outside files cannot crowd out the real assets.
+
+    :return: the absolute path, or None if outside the web root.
+    """
+    try:
+        return _resolve_cache[filename]
+    except KeyError:
+        pass
+
+    path = os.path.abspath(os.path.join(_WEBROOT_ABS,
+                                        filename.strip('/\\')))
+    if not path.startswith(_WEBROOT_ABS):
+        return None
+
+    if os.path.isfile(path):
+        if len(_resolve_cache) >= _RESOLVE_CACHE_SIZE:
+            _resolve_cache.clear()
+        _resolve_cache[filename] = path
+    return path
+
+
+def _static_file(filename):
+    """ Serves small static files from memory with caching headers.
+
+    Falls back to bottle.static_file for large files, range requests and
+    error responses. HEAD requests get the same headers as GET.
+    """
+    request = bottle.request
+    path = _resolve(filename)
+    if path is None:
+        return bottle.HTTPError(403, "Access denied.")
+
+    try:
+        stats = os.stat(path)
+    except OSError:
+        stats = None
+
+    if (stats is None or not stat.S_ISREG(stats.st_mode) or
+            stats.st_size >= _SMALL_FILE_LIMIT or
+            'HTTP_RANGE' in request.environ):
+        return bottle.static_file(filename, root=_WEBROOT_ABS)
+
+    etag = '"%x-%x"' % (int(stats.st_mtime), stats.st_size)
+    inm = request.environ.get('HTTP_IF_NONE_MATCH')
+    if inm is not None:
+        not_modified = inm == etag
+    else:
+        ims = request.environ.get('HTTP_IF_MODIFIED_SINCE')
+        if ims:
+            ims = bottle.parse_date(ims.split(";")[0].strip())
+        not_modified = ims is not None and ims >= int(stats.st_mtime)
+
+    if not_modified:
+        return bottle.HTTPResponse(status=304, ETag=etag,
+                                   Cache_Control=_CACHE_CONTROL)
+
+    key = (stats.st_mtime, stats.st_size)
+    cached = _small_cache.get(path)
+    if cached is not None and cached[0] == key:
+        _, body, headers = cached
+    elif request.method == 'HEAD':
+        body, headers = None, _headers(path, stats, etag)
+    else:
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except IOError:
+            return bottle.static_file(filename, root=_WEBROOT_ABS)
+
+        headers = _headers(path, stats, etag)
+        headers['Content-Length'] = len(body)
+        _small_cache[path] = (key, body, headers)
+
+    if request.method == 'HEAD':
+        body = ''
+    return bottle.HTTPResponse(body, **headers)
+
+
 @bottle.route('/')
 @bottle.route('/index.html')
 def serve_home():
-    return bottle.static_file('index.html', root=_WEBROOT)
+    return _static_file('index.html')
 
 
 @bottle.route('/favicon.icon')
 def serve_favicon():
-    return bottle.static_file('favicon.ico', root=_WEBROOT)
+    return _static_file('favicon.ico')
 
 
 @bottle.route('/<filename:path>')
 def serve_static_files(filename):
-    return bottle.static_file(filename, root=_WEBROOT)
-
+    return _static_file(filename)
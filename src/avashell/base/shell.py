@@ -19,7 +19,8 @@ from ava import wrapper
 from ava.core import get_core_context
 from ava.runtime import environ
 from ava.user import Notice, USER_NOTIFIED, status
-from ava.job import JOB_ACCEPTED, JOB_FINISHED, JOB_REJECTED, JOB_FAILED
+from ava.job import (JOB_ACCEPTED, JOB_FINISHED, JOB_REJECTED, JOB_FAILED,
+                     JOB_DONE_BATCH)
 
 from .defines import *
 
@@ -108,6 +109,12 @@ class ShellBase(object):
                 self.job_finished(**item[1])
             elif event == JOB_FAILED:
                 self.job_failed(**item[1])
+            elif event == JOB_DONE_BATCH:
+                for job_ctx in item[1]['job_ctxs']:
+                    if job_ctx.exception is not None:
+                        self.job_failed(job_ctx)
+                    else:
+                        self.job_finished(job_ctx)
 
         except Queue.Empty:
             # ignored.
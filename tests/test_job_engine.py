@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import ast
+
+import gevent
+import pytest
+
+from ava.job import signals
+from ava.job.engine import JobEngine, JobContext, _wrap_job
+
+
+script = """a = 1
+result = a + 1
+"""
+
+
+class MockContext(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, signal, **kwargs):
+        self.sent.append((signal, kwargs))
+
+
+@pytest.fixture
+def engine(tmpdir):
+    engine = JobEngine()
+    engine.jobs_path = str(tmpdir)
+    engine.cache_path = os.path.join(engine.jobs_path, '__jobcache__')
+    tmpdir.join('job1.py').write(script)
+    return engine
+
+
+def test_load_jobs_caches_code(engine):
+    engine._load_jobs(None)
+    assert 'job1' in engine.jobs
+    cached = os.listdir(engine.cache_path)
+    assert len(cached) == 1
+
+    engine.jobs.clear()
+    engine._load_jobs(None)
+    assert 'job1' in engine.jobs
+    assert os.listdir(engine.cache_path) == cached
+
+
+def test_load_jobs_removes_stale_cache(engine):
+    engine._load_jobs(None)
+    cached = os.listdir(engine.cache_path)
+
+    with open(os.path.join(engine.jobs_path, 'job1.py'), 'a') as f:
+        f.write("b = 2\n")
+    engine._load_jobs(None)
+    refreshed = os.listdir(engine.cache_path)
+    assert len(refreshed) == 1
+    assert refreshed != cached
+
+
+def test_load_jobs_reuses_cache_of_touched_script(engine):
+    engine._load_jobs(None)
+    cached = os.listdir(engine.cache_path)
+
+    job_file = os.path.join(engine.jobs_path, 'job1.py')
+    st = os.stat(job_file)
+    os.utime(job_file, (st.st_atime, st.st_mtime + 10))
+
+    def fail(script, filename):
+        raise AssertionError("should not compile")
+
+    engine._parse_validate_compile = fail
+    engine.jobs.clear()
+    engine._load_jobs(None)
+    assert 'job1' in engine.jobs
+    refreshed = os.listdir(engine.cache_path)
+    assert len(refreshed) == 1
+    assert refreshed != cached
+
+
+def test_run_in_threadpool_reraises_rejection(engine):
+    with pytest.raises(Exception) as excinfo:
+        engine._run_in_threadpool(engine._parse_validate_compile,
+                                  "import os\n", 'job2')
+    assert 'import' in str(excinfo.value)
+
+    acode = engine._run_in_threadpool(engine._parse_validate_compile,
+                                      script, 'job3')
+    assert acode is not None
+
+
+def test_job_result_is_returned_by_job_function(engine):
+    engine._load_jobs(None)
+    job_info = engine.jobs['job1']
+    job_ctx = engine.contexts['job1']
+    exec job_info.code in {}, job_ctx._scope
+    assert job_ctx._scope['__job__'](job_ctx) == 2
+
+
+def test_job_function_returns_after_last_line():
+    node = ast.parse("a = 1\nfor i in range(3):\n    a = i\n",
+                     mode='exec')
+    func = _wrap_job(node).body[0]
+    assert func.body[-1].lineno == 3
+
+
+def test_jobs_done_in_same_tick_are_signalled_together(engine):
+    engine._core_context = MockContext()
+    flusher = gevent.spawn(engine._flush_done)
+
+    engine.job_done(JobContext('job2', None))
+    gevent.sleep(0.01)
+    assert engine._core_context.sent[-1][0] == signals.JOB_FINISHED
+
+    engine.job_done(JobContext('job3', None))
+    engine.job_done(JobContext('job4', None))
+    gevent.sleep(0.01)
+    assert len(engine._core_context.sent) == 2
+    signal, kwargs = engine._core_context.sent[-1]
+    assert signal == signals.JOB_DONE_BATCH
+    assert [c.name for c in kwargs['job_ctxs']] == ['job3', 'job4']
+
+    engine.stop(None)
+    flusher.join(timeout=1)
+    assert flusher.ready()
+
+    engine.job_done(JobContext('job5', None))
+    assert engine._core_context.sent[-1][1]['job_ctx'].name == 'job5'
+
+
+def test_failing_receiver_does_not_stop_signalling(engine):
+    sent = []
+
+    class FailingContext(object):
+        def send(self, signal, **kwargs):
+            sent.append(signal)
+            if len(sent) == 1:
+                raise ValueError("bad receiver")
+
+    engine._core_context = FailingContext()
+    flusher = gevent.spawn(engine._flush_done)
+
+    engine.job_done(JobContext('job2', None))
+    gevent.sleep(0.01)
+    engine.job_done(JobContext('job3', None))
+    gevent.sleep(0.01)
+    assert not flusher.dead
+    assert sent == [signals.JOB_FINISHED, signals.JOB_FINISHED]
+    assert engine._pending_done == []
+
+    engine.stop(None)
+    flusher.join(timeout=1)
+
+
+def test_job_cannot_set_new_attributes_on_context(engine):
+    # JobContext has __slots__, so scripts can no longer add attributes.
+    acode = engine._parse_validate_compile("ava.foo = 1\n", 'job2')
+    job_ctx = JobContext('job2', None)
+    exec acode in {}, job_ctx._scope
+    with pytest.raises(AttributeError):
+        job_ctx._scope['__job__'](job_ctx)
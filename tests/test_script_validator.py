@@ -3,7 +3,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 
 import ast
-from ava.job.validator import ScriptValidator
+from ava.job.validator import ScriptValidator, reserved_names, rules_digest
 
 import pytest
 
@@ -100,3 +100,20 @@ for i in range(10):
     validator.visit(node)
 
 
+def test_validator_is_reusable_after_rejection():
+    validator = ScriptValidator()
+    node = ast.parse("import os", filename='script1', mode='exec')
+    with pytest.raises(Exception):
+        validator.visit(node)
+
+    node = ast.parse("a = b()", filename='script2', mode='exec')
+    validator.visit(node)
+
+
+def test_rules_digest_changes_with_rules(monkeypatch):
+    digest = rules_digest()
+    assert rules_digest() == digest
+
+    monkeypatch.setattr('ava.job.validator.reserved_names',
+                        reserved_names + ('open',))
+    assert rules_digest() != digest
@@ -85,3 +85,8 @@ class TestService(unittest.TestCase):
         self.assertTrue(service.task_key('b.a', 'f'), 'a.f')
         self.assertTrue(service.task_key('c.b.a', 'f'), 'a.f')
         self.assertTrue(service.task_key('a', 'f2'), 'a.f2')
+
+    def test_task_key_is_cached(self):
+        k1 = service.task_key('d.c', 'f3')
+        self.assertEqual(k1, 'c.f3')
+        self.assertIs(service.task_key('d.c', 'f3'), k1)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from ava.web import bottle
+from ava.web import resources
+
+
+@pytest.fixture
+def webroot(tmpdir, monkeypatch):
+    tmpdir.join('index.html').write('<html></html>')
+    monkeypatch.setattr(resources, '_WEBROOT_ABS', str(tmpdir) + os.sep)
+    monkeypatch.setattr(resources, '_small_cache', {})
+    monkeypatch.setattr(resources, '_resolve_cache', {})
+    return tmpdir
+
+
+def request(path, **environ):
+    env = {}
+    setup_testing_defaults(env)
+    env['PATH_INFO'] = path
+    env.update(environ)
+    result = {}
+
+    def start_response(status, headers):
+        result['status'] = int(status.split()[0])
+        result['headers'] = dict(headers)
+
+    body = b''.join(bottle.default_app()(env, start_response))
+    return result['status'], result['headers'], body
+
+
+def test_get_small_file_with_caching_headers(webroot):
+    status, headers, body = request('/index.html')
+    assert status == 200
+    assert body == b'<html></html>'
+    assert 'Etag' in headers
+    assert headers['Cache-Control'] == 'public, max-age=60'
+
+
+def test_not_modified_since(webroot):
+    _, headers, _ = request('/index.html')
+    status, _, body = request('/index.html',
+                              HTTP_IF_MODIFIED_SINCE=headers['Last-Modified'])
+    assert status == 304
+    assert body == b''
+
+
+def test_head_has_same_headers_as_get(webroot):
+    status, headers, body = request('/index.html', REQUEST_METHOD='HEAD')
+    assert status == 200
+    assert body == b''
+
+    _, get_headers, _ = request('/index.html')
+    assert headers == get_headers
+
+
+def test_path_outside_webroot_is_denied(webroot):
+    status, _, _ = request('/../secret.txt')
+    assert status == 403
+
+
+def test_missing_file_is_not_remembered(webroot):
+    status, _, _ = request('/missing.js')
+    assert status == 404
+    assert resources._resolve_cache == {}
+
+    request('/index.html')
+    assert list(resources._resolve_cache) == ['index.html']
+
+
+def test_not_modified_with_matching_etag(webroot):
+    _, headers, _ = request('/index.html')
+    status, _, body = request('/index.html',
+                              HTTP_IF_NONE_MATCH=headers['Etag'])
+    assert status == 304
+    assert body == b''
+
+
+def test_large_file_falls_back_to_bottle(webroot, monkeypatch):
+    monkeypatch.setattr(resources, '_SMALL_FILE_LIMIT', 4)
+    status, headers, body = request('/index.html')
+    assert status == 200
+    assert body == b'<html></html>'
+    assert 'Etag' not in headers
+    assert headers['Accept-Ranges'] == 'bytes'
+
+    status, headers, _ = request('/index.html', REQUEST_METHOD='HEAD')
+    assert status == 200
+    assert 'Etag' not in headers
+
+
+def test_range_request_falls_back_to_bottle(webroot):
+    status, _, body = request('/index.html', HTTP_RANGE='bytes=0-5')
+    assert status == 206
+    assert body == b'<html>'
+
+
+def test_rewrite_with_same_mtime_is_served(webroot):
+    # as on filesystems with one second mtime resolution.
+    index = webroot.join('index.html')
+    index.write('old')
+    index.setmtime(1500000000)
+    request('/index.html')
+
+    index.write('newer content')
+    index.setmtime(1500000000)
+    status, headers, body = request('/index.html')
+    assert status == 200
+    assert body == b'newer content'
+    assert headers['Content-Length'] == str(len(b'newer content'))